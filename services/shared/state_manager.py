@@ -1,18 +1,84 @@
+import copy
+import itertools
 import json
 import os
-import redis
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
 from typing import Dict, List, Any, Optional
 from datetime import datetime
 
-class RedisStateManager:
-    def __init__(self, host='redis', port=6379):
-        self.r = redis.Redis(host=host, port=port, decode_responses=True)
+class StateManager(ABC):
+    """Backend-agnostic store for carts, orders and stock overrides."""
+
+    @abstractmethod
+    def get_cart(self, session_id: str) -> Dict[str, Any]: ...
+
+    @abstractmethod
+    def update_cart(self, session_id: str, cart_data: Dict[str, Any]): ...
+
+    @abstractmethod
+    def clear_cart(self, session_id: str): ...
+
+    @abstractmethod
+    def create_order(self, order_data: Dict[str, Any]) -> str: ...
+
+    @abstractmethod
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]: ...
+
+    @abstractmethod
+    def update_stock(self, product_id: str, quantity: int) -> bool: ...
+
+    @abstractmethod
+    def get_stock(self, product_id: str) -> int: ...
+
+    @staticmethod
+    def _empty_cart() -> Dict[str, Any]:
+        return {"items": [], "total": 0.0, "item_count": 0}
+
+    @staticmethod
+    def _stamp_order(order_data: Dict[str, Any], order_count: int) -> str:
+        date_str = datetime.now().strftime("%Y%m%d")
+        order_id = f"ORD-{date_str}-{order_count:04d}"
+
+        order_data["order_id"] = order_id
+        order_data["created_at"] = datetime.now().isoformat()
+        order_data["updated_at"] = datetime.now().isoformat()
+        return order_id
+
+    @staticmethod
+    def _catalog_stock(product_id: str) -> Optional[int]:
+        # In this demo, stock is initially what's in products.py
+        from services.shared.products import get_product_by_id
+        product = get_product_by_id(product_id)
+        return product["stock"] if product else None
+
+class RedisStateManager(StateManager):
+    # KEYS[1] = stock key, ARGV[1] = quantity, ARGV[2] = catalog seed ("" if unknown).
+    # Returns 1 on success, 0 on insufficient stock, -1 if the key is missing
+    # and no seed was supplied.
+    DECREMENT_STOCK_SCRIPT = """
+    if redis.call('EXISTS', KEYS[1]) == 0 then
+        if ARGV[2] == '' then return -1 end
+        redis.call('SET', KEYS[1], ARGV[2])
+    end
+    if tonumber(redis.call('GET', KEYS[1])) >= tonumber(ARGV[1]) then
+        redis.call('DECRBY', KEYS[1], ARGV[1])
+        return 1
+    end
+    return 0
+    """
+
+    def __init__(self, host='redis', port=6379, db=0):
+        import redis
+        self.r = redis.Redis(host=host, port=port, db=db, decode_responses=True)
+        self._decrement_stock = self.r.register_script(self.DECREMENT_STOCK_SCRIPT)
 
     def get_cart(self, session_id: str) -> Dict[str, Any]:
         cart_json = self.r.get(f"cart:{session_id}")
         if cart_json:
             return json.loads(cart_json)
-        return {"items": [], "total": 0.0, "item_count": 0}
+        return self._empty_cart()
 
     def update_cart(self, session_id: str, cart_data: Dict[str, Any]):
         self.r.set(f"cart:{session_id}", json.dumps(cart_data))
@@ -21,14 +87,7 @@ class RedisStateManager:
         self.r.delete(f"cart:{session_id}")
 
     def create_order(self, order_data: Dict[str, Any]) -> str:
-        order_count = self.r.incr("order_counter")
-        date_str = datetime.now().strftime("%Y%m%d")
-        order_id = f"ORD-{date_str}-{order_count:04d}"
-        
-        order_data["order_id"] = order_id
-        order_data["created_at"] = datetime.now().isoformat()
-        order_data["updated_at"] = datetime.now().isoformat()
-        
+        order_id = self._stamp_order(order_data, self.r.incr("order_counter"))
         self.r.set(f"order:{order_id}", json.dumps(order_data))
         return order_id
 
@@ -39,35 +98,187 @@ class RedisStateManager:
         return None
 
     def update_stock(self, product_id: str, quantity: int) -> bool:
-        # In this demo, stock is initially what's in products.py
-        # We search redis for overrides first
+        # We search redis for overrides first; the catalog is only consulted
+        # when the key is missing, and the script seeds it atomically.
         stock_key = f"stock:{product_id}"
-        current_stock = self.r.get(stock_key)
-        
-        if current_stock is None:
-            from services.shared.products import get_product_by_id
-            product = get_product_by_id(product_id)
-            if not product: return False
-            current_stock = product["stock"]
-            self.r.set(stock_key, current_stock)
-        
-        current_stock = int(current_stock)
-        if current_stock >= quantity:
-            self.r.decrby(stock_key, quantity)
-            return True
-        return False
+        result = self._decrement_stock(keys=[stock_key], args=[quantity, ""])
+        if result == -1:
+            catalog_stock = self._catalog_stock(product_id)
+            if catalog_stock is None: return False
+            result = self._decrement_stock(keys=[stock_key], args=[quantity, catalog_stock])
+        return result == 1
 
     def get_stock(self, product_id: str) -> int:
         stock_key = f"stock:{product_id}"
         current_stock = self.r.get(stock_key)
         if current_stock is None:
-            from services.shared.products import get_product_by_id
-            product = get_product_by_id(product_id)
-            return product["stock"] if product else 0
+            return self._catalog_stock(product_id) or 0
         return int(current_stock)
 
+class InMemoryStateManager(StateManager):
+    """Process-local backend for tests and benchmarks.
+
+    State lives in the importing process only, so it is not shared between
+    agents running as separate services; use it only when every caller
+    shares one process. Reads and plain writes rely on atomic dict operations; only the stock
+    check-and-decrement takes a lock. Values are deep-copied on the way in
+    and out so callers get the same isolation as with a remote store.
+    """
+
+    def __init__(self):
+        self._carts: Dict[str, Dict[str, Any]] = {}
+        self._orders: Dict[str, Dict[str, Any]] = {}
+        self._stock: Dict[str, int] = {}
+        self._order_counter = itertools.count(1)
+        self._stock_lock = threading.Lock()
+
+    def get_cart(self, session_id: str) -> Dict[str, Any]:
+        cart = self._carts.get(session_id)
+        if cart:
+            return copy.deepcopy(cart)
+        return self._empty_cart()
+
+    def update_cart(self, session_id: str, cart_data: Dict[str, Any]):
+        self._carts[session_id] = copy.deepcopy(cart_data)
+
+    def clear_cart(self, session_id: str):
+        self._carts.pop(session_id, None)
+
+    def create_order(self, order_data: Dict[str, Any]) -> str:
+        order_id = self._stamp_order(order_data, next(self._order_counter))
+        self._orders[order_id] = copy.deepcopy(order_data)
+        return order_id
+
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        order = self._orders.get(order_id)
+        return copy.deepcopy(order) if order is not None else None
+
+    def update_stock(self, product_id: str, quantity: int) -> bool:
+        with self._stock_lock:
+            current_stock = self._stock.get(product_id)
+            if current_stock is None:
+                current_stock = self._catalog_stock(product_id)
+                if current_stock is None: return False
+            if current_stock >= quantity:
+                self._stock[product_id] = current_stock - quantity
+                return True
+            self._stock[product_id] = current_stock
+            return False
+
+    def get_stock(self, product_id: str) -> int:
+        current_stock = self._stock.get(product_id)
+        if current_stock is None:
+            return self._catalog_stock(product_id) or 0
+        return current_stock
+
+class SQLiteStateManager(StateManager):
+    """File-backed backend using SQLite in WAL mode for durable single-host state.
+
+    Every agent must point at the same database file, e.g. on a shared volume.
+    """
+
+    def __init__(self, path: str = '/data/state.db'):
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS carts (session_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS orders (order_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+                CREATE TABLE IF NOT EXISTS stock (product_id TEXT PRIMARY KEY, quantity INTEGER NOT NULL);
+                CREATE TABLE IF NOT EXISTS counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL);
+            """)
+
+    def _fetch_one(self, query: str, params: tuple) -> Optional[tuple]:
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()
+
+    def get_cart(self, session_id: str) -> Dict[str, Any]:
+        row = self._fetch_one("SELECT data FROM carts WHERE session_id = ?", (session_id,))
+        if row:
+            return json.loads(row[0])
+        return self._empty_cart()
+
+    def update_cart(self, session_id: str, cart_data: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO carts (session_id, data) VALUES (?, ?)",
+                (session_id, json.dumps(cart_data))
+            )
+
+    def clear_cart(self, session_id: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM carts WHERE session_id = ?", (session_id,))
+
+    def create_order(self, order_data: Dict[str, Any]) -> str:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute(
+                    "INSERT INTO counters (name, value) VALUES ('order_counter', 1) "
+                    "ON CONFLICT(name) DO UPDATE SET value = value + 1"
+                )
+                order_count = self._conn.execute(
+                    "SELECT value FROM counters WHERE name = 'order_counter'"
+                ).fetchone()[0]
+                order_id = self._stamp_order(order_data, order_count)
+                self._conn.execute(
+                    "INSERT INTO orders (order_id, data) VALUES (?, ?)",
+                    (order_id, json.dumps(order_data))
+                )
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+        return order_id
+
+    def get_order(self, order_id: str) -> Optional[Dict[str, Any]]:
+        row = self._fetch_one("SELECT data FROM orders WHERE order_id = ?", (order_id,))
+        if row:
+            return json.loads(row[0])
+        return None
+
+    def update_stock(self, product_id: str, quantity: int) -> bool:
+        decrement = "UPDATE stock SET quantity = quantity - ? WHERE product_id = ? AND quantity >= ?"
+        with self._lock:
+            if self._conn.execute(decrement, (quantity, product_id, quantity)).rowcount == 1:
+                return True
+            if self._conn.execute(
+                "SELECT 1 FROM stock WHERE product_id = ?", (product_id,)
+            ).fetchone():
+                return False
+            # First decrement for this product: seed the row from the catalog
+            catalog_stock = self._catalog_stock(product_id)
+            if catalog_stock is None: return False
+            self._conn.execute(
+                "INSERT OR IGNORE INTO stock (product_id, quantity) VALUES (?, ?)",
+                (product_id, catalog_stock)
+            )
+            return self._conn.execute(decrement, (quantity, product_id, quantity)).rowcount == 1
+
+    def get_stock(self, product_id: str) -> int:
+        row = self._fetch_one("SELECT quantity FROM stock WHERE product_id = ?", (product_id,))
+        if row is None:
+            return self._catalog_stock(product_id) or 0
+        return row[0]
+
+def create_state_manager(backend: Optional[str] = None) -> StateManager:
+    """Build the backend named by ``backend`` or the STATE_BACKEND env var."""
+    backend = (backend or os.getenv("STATE_BACKEND", "redis")).lower()
+    if backend == "redis":
+        return RedisStateManager(
+            host=os.getenv("REDIS_HOST", "redis"),
+            port=int(os.getenv("REDIS_PORT", 6379)),
+            db=int(os.getenv("REDIS_DB", 0))
+        )
+    if backend == "memory":
+        return InMemoryStateManager()
+    if backend == "sqlite":
+        return SQLiteStateManager(path=os.getenv("SQLITE_PATH", "/data/state.db"))
+    raise ValueError(f"Unknown state backend: {backend!r} (expected redis, memory or sqlite)")
+
 # Initialize global state manager
-state_manager = RedisStateManager(
-    host=os.getenv("REDIS_HOST", "redis"),
-    port=int(os.getenv("REDIS_PORT", 6379))
-)
+state_manager = create_state_manager()
@@ -0,0 +1,5 @@
+import os
+
+# Importing services.shared.state_manager builds the module-level backend;
+# keep that off the network so the suite runs without a Redis server.
+os.environ.setdefault("STATE_BACKEND", "memory")
@@ -0,0 +1,144 @@
+import functools
+import os
+import re
+import threading
+import time
+
+import pytest
+
+from services.shared.products import get_product_by_id
+from services.shared.state_manager import (
+    InMemoryStateManager,
+    RedisStateManager,
+    SQLiteStateManager,
+)
+
+PRODUCT_ID = "ELEC001"
+UNKNOWN_PRODUCT_ID = "NOPE999"
+CATALOG_STOCK = get_product_by_id(PRODUCT_ID)["stock"]
+THROUGHPUT_OPS = 2000
+MIN_OPS_PER_SECOND = 500
+
+
+REDIS_HOST = os.getenv("REDIS_HOST", "localhost")
+REDIS_PORT = int(os.getenv("REDIS_PORT", 6379))
+REDIS_TEST_DB = int(os.getenv("REDIS_TEST_DB", 15))
+
+
+@functools.lru_cache(maxsize=None)
+def _redis_reachable() -> bool:
+    import redis
+
+    try:
+        return redis.Redis(host=REDIS_HOST, port=REDIS_PORT, socket_connect_timeout=1).ping()
+    except (redis.exceptions.ConnectionError, redis.exceptions.TimeoutError):
+        return False
+
+
+def _redis_state_manager():
+    pytest.importorskip("redis")
+    if not _redis_reachable():
+        pytest.skip(f"no Redis server reachable at {REDIS_HOST}:{REDIS_PORT}")
+    sm = RedisStateManager(host=REDIS_HOST, port=REDIS_PORT, db=REDIS_TEST_DB)
+    sm.r.flushdb()
+    return sm
+
+
+@pytest.fixture(params=["memory", "sqlite", "redis"])
+def state_manager(request, tmp_path):
+    if request.param == "memory":
+        yield InMemoryStateManager()
+    elif request.param == "sqlite":
+        yield SQLiteStateManager(path=str(tmp_path / "state.db"))
+    else:
+        sm = _redis_state_manager()
+        yield sm
+        sm.r.flushdb()
+
+
+def test_get_cart_defaults_to_empty(state_manager):
+    assert state_manager.get_cart("test-session") == {"items": [], "total": 0.0, "item_count": 0}
+
+
+def test_cart_round_trip_and_clear(state_manager):
+    cart = {
+        "items": [{"product_id": PRODUCT_ID, "name": "Headphones", "price": 149.99, "quantity": 2, "subtotal": 299.98}],
+        "total": 299.98,
+        "item_count": 2,
+    }
+    state_manager.update_cart("test-session", cart)
+    assert state_manager.get_cart("test-session") == cart
+    assert state_manager.get_cart("other-session")["items"] == []
+
+    state_manager.clear_cart("test-session")
+    assert state_manager.get_cart("test-session")["items"] == []
+
+
+def test_create_order_assigns_sequential_ids(state_manager):
+    first = state_manager.create_order({"items": [], "total": 10.0, "status": "confirmed"})
+    second = state_manager.create_order({"items": [], "total": 20.0, "status": "confirmed"})
+
+    assert re.fullmatch(r"ORD-\d{8}-\d{4}", first)
+    assert int(second.rsplit("-", 1)[1]) == int(first.rsplit("-", 1)[1]) + 1
+
+    order = state_manager.get_order(first)
+    assert order["order_id"] == first
+    assert order["total"] == 10.0
+    assert order["status"] == "confirmed"
+    assert "created_at" in order and "updated_at" in order
+
+
+def test_get_order_missing_returns_none(state_manager):
+    assert state_manager.get_order("ORD-20000101-9999") is None
+
+
+def test_stock_defaults_to_catalog(state_manager):
+    assert state_manager.get_stock(PRODUCT_ID) == CATALOG_STOCK
+
+
+def test_update_stock_decrements_and_refuses_oversell(state_manager):
+    assert state_manager.update_stock(PRODUCT_ID, 5) is True
+    assert state_manager.get_stock(PRODUCT_ID) == CATALOG_STOCK - 5
+
+    assert state_manager.update_stock(PRODUCT_ID, CATALOG_STOCK) is False
+    assert state_manager.get_stock(PRODUCT_ID) == CATALOG_STOCK - 5
+
+    assert state_manager.update_stock(PRODUCT_ID, CATALOG_STOCK - 5) is True
+    assert state_manager.get_stock(PRODUCT_ID) == 0
+
+
+def test_unknown_product_has_no_stock(state_manager):
+    assert state_manager.update_stock(UNKNOWN_PRODUCT_ID, 1) is False
+    assert state_manager.get_stock(UNKNOWN_PRODUCT_ID) == 0
+
+
+def test_concurrent_decrements_do_not_oversell(state_manager):
+    workers = CATALOG_STOCK + 20
+    barrier = threading.Barrier(workers)
+    results = []
+
+    def buy_one():
+        barrier.wait()
+        results.append(state_manager.update_stock(PRODUCT_ID, 1))
+
+    threads = [threading.Thread(target=buy_one) for _ in range(workers)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    assert results.count(True) == CATALOG_STOCK
+    assert state_manager.get_stock(PRODUCT_ID) == 0
+
+
+def test_cart_throughput(state_manager):
+    cart = {"items": [], "total": 0.0, "item_count": 0}
+    start = time.perf_counter()
+    for i in range(THROUGHPUT_OPS):
+        state_manager.update_cart(f"bench-{i}", cart)
+        state_manager.get_cart(f"bench-{i}")
+    elapsed = time.perf_counter() - start
+
+    ops_per_second = 2 * THROUGHPUT_OPS / elapsed
+    print(f"{type(state_manager).__name__}: {ops_per_second:,.0f} cart ops/s")
+    assert ops_per_second >= MIN_OPS_PER_SECOND